@@ -1,17 +1,38 @@
 import pandas as pd
 
+# Colunas utilizadas do arquivo original e seus novos nomes
+COLUMN_NAMES = {
+    "Registro: Identificador": "r_reg",
+    "Registro: Longitude": "r_long",
+    "Registro: Latitude": "r_lat",
+    "Registro: Data de observação (ISO)": "r_data",
+    "Registro: Estado": "r_estado",
+    "Registro: Município": "r_municipio",
+    "Registro: Origem da localização": "r_origem",
+    "Registro: Precisão": "r_precisao",
+    "Animal: Identificador": "a_ident",
+    "Animal: Tipo": "a_tipo",
+    "Animal: Quantidade observada": "a_quantidade",
+    "Animal: Situação": "a_situacao",
+    "Animal: Comportamento": "a_comportamento",
+    "Animal: Condição física": "a_condicao",
+    "Animal: Causa morte": "a_causa_morte",
+    "Desfecho: Doença": "d_doenca",
+    "Desfecho: Classificação": "d_classificacao"
+}
+
 def preprocess_data(input_csv):
     """
     Realiza o pré-processamento de um arquivo CSV de registros.
 
     O pré-processamento inclui as seguintes etapas:
-    1. Renomeia as colunas do DataFrame para nomes mais curtos e padronizados.
-    2. Converte a coluna 'r_data' para o tipo de dado datetime e mantém apenas a data.
-    3. Filtra os dados para incluir apenas registros onde a origem da localização
+    1. Lê apenas as colunas utilizadas e as renomeia para nomes mais curtos e padronizados.
+    2. Filtra os dados para incluir apenas registros onde a origem da localização
        é "Obtido pelo GPS ou informado explicitamente".
-    4. Filtra ainda mais os dados para incluir apenas registros com uma precisão
+    3. Filtra ainda mais os dados para incluir apenas registros com uma precisão
        inferior a 100 metros (ou seja, 'r_precisao' < 100).
-    5. Remove registros onde o valor de 'r_precisao' é -1.
+    4. Remove registros onde o valor de 'r_precisao' é -1.
+    5. Converte a coluna 'r_data' para o tipo de dado datetime e mantém apenas a data.
 
     Args:
         input_csv (str): O caminho do arquivo CSV de entrada.
@@ -20,45 +41,37 @@ def preprocess_data(input_csv):
         pandas.DataFrame: O DataFrame processado e filtrado.
     """
     try:
-        # 1 -- Lendo arquivos de entrada
-        base_original = pd.read_csv(input_csv, encoding='latin-1', sep=';')
+        # 1 -- Lendo arquivos de entrada (apenas as colunas utilizadas, com tipos explícitos)
+        base_original = pd.read_csv(
+            input_csv,
+            encoding='latin-1',
+            sep=';',
+            usecols=list(COLUMN_NAMES),
+            dtype={
+                "Registro: Origem da localização": "category",
+                "Registro: Precisão": "float32",
+                "Registro: Latitude": "float64",
+                "Registro: Longitude": "float64",
+            },
+        )
 
         # Renomeando colunas
-        df = base_original.rename(columns={
-            "Registro: Identificador": "r_reg",
-            "Registro: Longitude": "r_long",
-            "Registro: Latitude": "r_lat",
-            "Registro: Data de observação (ISO)": "r_data",
-            "Registro: Estado": "r_estado",
-            "Registro: Município": "r_municipio",
-            "Registro: Origem da localização": "r_origem",
-            "Registro: Precisão": "r_precisao",
-            "Animal: Identificador": "a_ident",
-            "Animal: Tipo": "a_tipo",
-            "Animal: Quantidade observada": "a_quantidade",
-            "Animal: Situação": "a_situacao",
-            "Animal: Comportamento": "a_comportamento",
-            "Animal: Condição física": "a_condicao",
-            "Animal: Causa morte": "a_causa_morte",
-            "Desfecho: Doença": "d_doenca",
-            "Desfecho: Classificação": "d_classificacao"
-        })
-
-        # Converter a coluna 'r_data' para o formato datetime e extrair apenas a data
-        df['r_data'] = pd.to_datetime(df['r_data']).dt.date
+        df = base_original.rename(columns=COLUMN_NAMES)
 
-        # 2 -- Filtrando os dados
-        # Filtrar por origem de localização
-        data_gps = df[df['r_origem'] == "Obtido pelo GPS ou informado explicitamente"]
-        
-        # Filtrar por precisão < 100
-        data_gps_prec = data_gps[data_gps['r_precisao'] < 100]
-
-        # Remover valores de precisão igual a -1
-        data_gps_prec_final = data_gps_prec[data_gps_prec['r_precisao'] != -1]
+        # 2 -- Filtrando os dados com uma única máscara:
+        # origem da localização por GPS, precisão < 100 e precisão diferente de -1
+        mask = (
+            (df['r_origem'] == "Obtido pelo GPS ou informado explicitamente")
+            & (df['r_precisao'] < 100)
+            & (df['r_precisao'] != -1)
+        )
 
         # Cria uma cópia do dataframe final 
-        X = data_gps_prec_final.copy()
+        X = df[mask].copy()
+
+        # Converter a coluna 'r_data' (ISO 8601) para datetime e manter apenas a data,
+        # preservando o tipo datetime64 (evita objetos 'date' do Python)
+        X['r_data'] = pd.to_datetime(X['r_data'], format='ISO8601', cache=True).dt.normalize()
         
         print("Pré-processamento concluído.")
         print(f"O DataFrame final contém {len(X)} registros.")
@@ -1,49 +1,111 @@
+import os
+import numpy as np
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Point
+from joblib import Parallel, delayed, effective_n_jobs
 
-def geocode_data(input_csv, output_csv_7d, output_csv_6d, mun_shp, uf_shp):
+def load_municipalities(mun_shp, uf_shp, mun_cache=None):
+    """
+    Carrega os polígonos dos municípios com a sigla da UF, reprojetados para
+    EPSG:4326 (o mesmo CRS dos pontos).
+
+    Se 'mun_cache' for informado, a camada reprojetada é salva em GeoParquet
+    e reutilizada nas execuções seguintes, evitando a leitura do shapefile e a
+    reprojeção. Apague o cache se os shapefiles forem atualizados.
+    """
+    if mun_cache is not None and os.path.exists(mun_cache):
+        return gpd.read_parquet(mun_cache)
+
+    # Carregar os shapefiles
+    gdf_mun = gpd.read_file(mun_shp)
+    gdf_uf = gpd.read_file(uf_shp)
+
+    # Selecionar colunas relevantes e renomear a sigla da UF
+    gdf_uf_reduzido = gdf_uf[['CD_UF', 'SIGLA_UF']]
+
+    # Juntar a sigla da UF ao GeoDataFrame de municípios
+    gdf_mun = gdf_mun.merge(gdf_uf_reduzido, on='CD_UF', how='left')
+
+    # Reprojetar os polígonos (uma única vez) em vez de reprojetar todos os pontos
+    gdf_mun = gdf_mun[['CD_MUN', 'NM_MUN', 'SIGLA_UF', 'geometry']].to_crs("EPSG:4326")
+
+    if mun_cache is not None:
+        gdf_mun.to_parquet(mun_cache)
+
+    return gdf_mun
+
+def spatial_join_points(gdf_coords, gdf_mun, n_jobs=None):
+    """
+    Realiza o spatial join ('within') dos pontos com os municípios.
+
+    Com 'n_jobs' > 1 (ou -1 para todos os núcleos), os pontos são divididos em blocos
+    processados em paralelo por threads (o Shapely 2 libera o GIL nas operações
+    geométricas); os polígonos dos municípios são compartilhados entre os blocos.
+    """
+    n_jobs = effective_n_jobs(n_jobs)
+    if n_jobs == 1:
+        return gpd.sjoin(gdf_coords, gdf_mun, how='left', predicate='within')
+
+    blocos = np.array_split(np.arange(len(gdf_coords)), n_jobs)
+    joins = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(gpd.sjoin)(gdf_coords.iloc[bloco], gdf_mun, how='left', predicate='within')
+        for bloco in blocos
+    )
+    return pd.concat(joins)
+
+def geocode_data(input_csv, output_csv_7d, output_csv_6d, mun_shp, uf_shp, mun_cache=None, n_jobs=None, df_pontos=None):
     """
     Atribui geocodes a um DataFrame de pontos usando shapefiles do IBGE.
 
     Args:
         input_csv (str): O caminho do arquivo CSV de entrada que contém as coordenadas.
-        output_csv_7d (str): O caminho para salvar o arquivo CSV com geocodes de 7 dígitos.
-        output_csv_6d (str): O caminho para salvar o arquivo CSV com geocodes de 6 dígitos.
+                         Ignorado se 'df_pontos' for informado.
+        output_csv_7d (str): O caminho para salvar o arquivo CSV com geocodes de 7 dígitos
+                             (None para não salvar).
+        output_csv_6d (str): O caminho para salvar o arquivo CSV com geocodes de 6 dígitos
+                             (None para não salvar).
         mun_shp (str): O caminho do shapefile de municípios.
         uf_shp (str): O caminho do shapefile de unidades federativas (estados).
+        mun_cache (str, opcional): O caminho do arquivo GeoParquet usado como cache
+                                   da camada de municípios reprojetada.
+        n_jobs (int, opcional): Número de threads para o spatial join (-1 usa todos os núcleos).
+        df_pontos (pd.DataFrame, opcional): DataFrame de pontos já carregado em memória
+                                            (por exemplo, a saída de preprocess_data).
 
     Returns:
         tuple: Uma tupla contendo o DataFrame com geocodes de 7 dígitos e o DataFrame
                com geocodes de 6 dígitos. Retorna (None, None) se ocorrer um erro.
     """
     try:
-        # Carregar os shapefiles
-        gdf_mun = gpd.read_file(mun_shp)
-        gdf_uf = gpd.read_file(uf_shp)
-
-        # Selecionar colunas relevantes e renomear a sigla da UF
-        gdf_uf_reduzido = gdf_uf[['CD_UF', 'SIGLA_UF']]
-
-        # Juntar a sigla da UF ao GeoDataFrame de municípios
-        gdf_mun = gdf_mun.merge(gdf_uf_reduzido, on='CD_UF', how='left')
+        # Carregar os municípios (em EPSG:4326) com a sigla da UF
+        gdf_mun = load_municipalities(mun_shp, uf_shp, mun_cache)
 
-        # Carregar o CSV de entrada
-        df_pontos = pd.read_csv(input_csv)
+        if df_pontos is None:
+            # Carregar o CSV de entrada (leitor multithread do PyArrow)
+            df_pontos = pd.read_csv(input_csv, engine='pyarrow')
+        else:
+            # Cópia rasa: as novas colunas não são adicionadas ao DataFrame do chamador
+            df_pontos = df_pontos.copy(deep=False)
 
         # Criar o GeoDataFrame a partir do DataFrame de pontos
+        # (geometrias construídas de forma vetorizada; o DataFrame não é copiado)
         def coordenadas_para_geodf(df, lat_col='r_lat', lon_col='r_long'):
-            geometry = [Point(lon, lat) for lat, lon in zip(df[lat_col], df[lon_col])]
-            return gpd.GeoDataFrame(df.copy(), geometry=geometry, crs="EPSG:4326")
+            geometry = gpd.points_from_xy(df[lon_col], df[lat_col])
+            return gpd.GeoDataFrame(df, geometry=geometry, crs="EPSG:4326")
 
+        # Os pontos já estão no mesmo CRS dos municípios (EPSG:4326)
         gdf_coords = coordenadas_para_geodf(df_pontos)
 
+        # Manter apenas os municípios que intersectam a extensão (bounding box) dos pontos,
+        # reduzindo o índice espacial e os testes de 'within' do spatial join
+        minx, miny, maxx, maxy = gdf_coords.total_bounds
+        gdf_mun = gdf_mun.cx[minx:maxx, miny:maxy]
+
         # Realizar o spatial join para encontrar o município de cada ponto
-        gdf_join = gpd.sjoin(
-            gdf_coords.to_crs(gdf_mun.crs),  # Reprojetar para o CRS do shapefile de municípios
+        gdf_join = spatial_join_points(
+            gdf_coords,
             gdf_mun[['CD_MUN', 'NM_MUN', 'SIGLA_UF', 'geometry']],
-            how='left',
-            predicate='within'
+            n_jobs
         )
 
         # Adicionar as novas colunas ao DataFrame original
@@ -56,21 +118,20 @@ def geocode_data(input_csv, output_csv_7d, output_csv_6d, mun_shp, uf_shp):
         if not df_com_nulos.empty:
             print("Registros com UF nulo encontrados e removidos:")
             print(df_com_nulos[['r_reg', 'r_lat', 'r_long', 'r_estado', 'r_municipio']])
-            df_novo = df_pontos.dropna(subset=['UF']).copy()
-        else:
-            df_novo = df_pontos.copy()
+        df_novo = df_pontos.dropna(subset=['UF'])
 
         # Salvar o arquivo com geocode de 7 dígitos
-        df_novo.to_csv(output_csv_7d, index=False)
-        print(f"Arquivo com geocodes de 7 dígitos salvo como '{output_csv_7d}'.")
+        if output_csv_7d is not None:
+            df_novo.to_csv(output_csv_7d, index=False)
+            print(f"Arquivo com geocodes de 7 dígitos salvo como '{output_csv_7d}'.")
+
+        # Geocode de 6 dígitos: remove o dígito verificador por divisão inteira
+        X = df_novo.assign(geocode=df_novo['geocode'].astype('int64') // 10)
 
-        # Criar uma cópia para o arquivo de 6 dígitos
-        X = df_novo.copy()
-        X['geocode'] = X['geocode'].astype(str).str[:-1]
-        
         # Salvar o arquivo com geocode de 6 dígitos
-        X.to_csv(output_csv_6d, index=False)
-        print(f"Arquivo com geocodes de 6 dígitos salvo como '{output_csv_6d}'.")
+        if output_csv_6d is not None:
+            X.to_csv(output_csv_6d, index=False)
+            print(f"Arquivo com geocodes de 6 dígitos salvo como '{output_csv_6d}'.")
 
         return df_novo, X
 
@@ -91,9 +152,10 @@ if __name__ == '__main__':
     output_6d_file = f'{path}/{file}_limpo_geocode_6d.csv'
     municipios_shp = f'{path}/BR_Municipios_2023/BR_Municipios_2023.shp'
     uf_shp = f'{path}/BR_UF_2023/BR_UF_2023.shp'
+    municipios_cache = f'{path}/BR_Municipios_2023/BR_Municipios_2023_4326.parquet'
 
     # Chama a função principal
-    df_7d, df_6d = geocode_data(input_file, output_7d_file, output_6d_file, municipios_shp, uf_shp)
+    df_7d, df_6d = geocode_data(input_file, output_7d_file, output_6d_file, municipios_shp, uf_shp, municipios_cache, n_jobs=-1)
 
     if df_7d is not None and df_6d is not None:
         print("\nProcessamento concluído com sucesso.")
@@ -1,139 +1,266 @@
+import math
 import numpy as np
 import pandas as pd
 import os
-from geopy.distance import geodesic
+from scipy.sparse import csr_matrix
 from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
 
-def within_distance_limit(point1, point2, distance_limit):
+# Numba é opcional: acelera o cálculo das matrizes densas (modo de depuração)
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Raio médio da Terra (IUGG), em km
+EARTH_RADIUS_KM = 6371.0088
+
+# Valor normalizado atribuído aos pares fora dos limites de distância ou tempo
+OUT_OF_LIMIT = 99999
+
+def haversine_matrix(lat, lon):
     """
-    Calcula a distância geodésica entre dois pontos e retorna a distância
-    em km se estiver dentro do limite, caso contrário retorna -1.
+    Calcula a distância (em km) entre todos os pares de pontos pela fórmula
+    de Haversine, usando broadcasting do NumPy. Os ângulos devem estar em radianos.
     """
-    distance = geodesic((point1['r_lat'], point1['r_long']), (point2['r_lat'], point2['r_long'])).km
-    if distance <= distance_limit:
-        return distance
-    else:
-        return -1
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    cos_lat = np.cos(lat)
+    a = np.sin(dlat / 2) ** 2 + cos_lat[:, None] * cos_lat[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def within_distance_limit(distance, distance_limit):
+    """
+    Mantém as distâncias (em km) dentro do limite e substitui as demais por -1.
+    """
+    return np.where(distance <= distance_limit, distance, -1)
+
+def within_time_limit(delta, time_limit):
+    """
+    Mantém as diferenças de tempo (em dias) dentro do limite e substitui as demais por -1.
+    """
+    return np.where(delta <= time_limit, delta, -1)
+
+def normalization_scale(limit):
+    """
+    Retorna o denominador da normalização: o próprio limite (maior valor possível
+    entre os pares dentro dele), ou 1 quando o limite é zero.
+    """
+    return limit if limit > 0 else 1
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _pairwise_dist_time(lat, lon, days, distance_limit, time_limit, distance_scale, time_scale,
+                            matrix_dist, matrix_time, total_distance):
+        """
+        Kernel compilado (Numba) que preenche as matrizes de distância, tempo e
+        distância total normalizada (já alocadas, com diagonal zero) par a par,
+        em paralelo sobre as linhas. Os ângulos devem estar em radianos.
+        """
+        n = lat.shape[0]
+        cos_lat = np.cos(lat)
 
-def within_time_limit(date1, date2, time_limit):
+        for i in prange(n):
+            lat_i = lat[i]
+            lon_i = lon[i]
+            cos_i = cos_lat[i]
+            day_i = days[i]
+            for j in range(i + 1, n):
+                sin_dlat = math.sin((lat[j] - lat_i) / 2)
+                sin_dlon = math.sin((lon[j] - lon_i) / 2)
+                a = sin_dlat * sin_dlat + cos_i * cos_lat[j] * sin_dlon * sin_dlon
+                distance = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+                if distance > distance_limit:
+                    distance = -1.0
+                    norm_distance = OUT_OF_LIMIT
+                else:
+                    norm_distance = distance / distance_scale
+                matrix_dist[i, j] = distance
+                matrix_dist[j, i] = distance
+
+                delta = abs(days[j] - day_i)
+                if delta > time_limit:
+                    delta = -1
+                    norm_time = OUT_OF_LIMIT
+                else:
+                    norm_time = delta / time_scale
+                matrix_time[i, j] = delta
+                matrix_time[j, i] = delta
+
+                total_distance[i, j] = norm_distance + norm_time
+                total_distance[j, i] = norm_distance + norm_time
+
+def extract_arrays(X):
     """
-    Calcula a diferença de tempo em dias entre duas datas e retorna a diferença
-    se estiver dentro do limite, caso contrário retorna -1.
+    Extrai, uma única vez, as coordenadas (em radianos) e as datas (em dias)
+    dos registros como arrays NumPy contíguos.
     """
-    delta = abs((date1['r_data'] - date2['r_data']).days)
-    if delta <= time_limit:
-        return delta
-    else:
-        return -1
+    lat = np.deg2rad(X['r_lat'].to_numpy(dtype=np.float64))
+    lon = np.deg2rad(X['r_long'].to_numpy(dtype=np.float64))
+    days = np.asarray(X['r_data'], dtype='datetime64[D]').astype(np.int64)
+    return lat, lon, days
 
-def calculate_dist_time(X, time_limit, distance_limit):
+def calculate_dist_time(lat, lon, days, time_limit, distance_limit):
     """
-    Calcula as matrizes de distância espacial e temporal entre todos os pontos.
+    Calcula as matrizes de distância espacial e temporal entre todos os pontos
+    e a matriz de distância total (soma das distâncias normalizadas pelos limites).
+
+    Usa o kernel compilado com Numba quando disponível; caso contrário,
+    recorre ao cálculo vetorizado com NumPy.
+
+    As matrizes usam float32 (erro inferior a 1 m nas distâncias) e a matriz
+    de tempo usa int16 quando o limite de tempo cabe nesse tipo, reduzindo pela
+    metade (ou mais) a memória ocupada pelas matrizes n x n.
     """
-    n = len(X)
-    matrix_dist = np.zeros((n, n))
-    matrix_time = np.zeros((n, n))
+    n = len(lat)
+    lat = lat.astype(np.float32)
+    lon = lon.astype(np.float32)
+    time_dtype = np.int16 if time_limit <= np.iinfo(np.int16).max else np.int32
+    distance_scale = normalization_scale(distance_limit)
+    time_scale = normalization_scale(time_limit)
+
+    if NUMBA_AVAILABLE:
+        matrix_dist = np.zeros((n, n), dtype=np.float32)
+        matrix_time = np.zeros((n, n), dtype=time_dtype)
+        total_distance = np.zeros((n, n), dtype=np.float32)
+        _pairwise_dist_time(lat, lon, days, distance_limit, time_limit, distance_scale, time_scale,
+                            matrix_dist, matrix_time, total_distance)
+        return matrix_dist, matrix_time, total_distance
+
+    matrix_dist = within_distance_limit(haversine_matrix(lat, lon), distance_limit)
 
-    for i in range(n):
-        for j in range(i + 1, n):
-            distance = within_distance_limit(X.iloc[i], X.iloc[j], distance_limit)
-            matrix_dist[i][j] = distance
-            matrix_dist[j][i] = matrix_dist[i][j]
+    delta = np.abs(days[:, None] - days[None, :])
+    matrix_time = within_time_limit(delta, time_limit).astype(time_dtype)
 
-            dist_time = within_time_limit(X.iloc[i], X.iloc[j], time_limit)
-            matrix_time[i][j] = dist_time
-            matrix_time[j][i] = matrix_time[i][j]
+    total_distance = (np.where(matrix_dist < 0, OUT_OF_LIMIT, matrix_dist / distance_scale)
+                      + np.where(matrix_time < 0, OUT_OF_LIMIT, matrix_time / time_scale))
 
-    return matrix_dist, matrix_time
+    return matrix_dist, matrix_time, total_distance
 
-def calculate_normalized_matrices(distance_matrix, time_matrix):
+def calculate_neighborhood_graph(lat, lon, days, time_limit, distance_limit, n_jobs=None):
     """
-    Normaliza as matrizes de distância e tempo.
+    Calcula a matriz esparsa (CSR) de distância total normalizada contendo apenas
+    os pares de pontos dentro dos limites espacial e temporal.
+
+    Os vizinhos espaciais são obtidos com uma BallTree (métrica haversine), evitando
+    o cálculo das matrizes densas n x n. Pares fora dos limites não são armazenados
+    e, portanto, nunca são considerados vizinhos pelo DBSCAN.
+
+    As consultas de raio na BallTree são divididas em blocos executados em paralelo
+    ('n_jobs' threads, -1 para usar todos os núcleos).
     """
-    n = distance_matrix.shape[0]
-    max_dist = np.max(distance_matrix[distance_matrix >= 0])
-    max_time = np.max(time_matrix[time_matrix >= 0])
+    n = len(lat)
+    coords = np.column_stack((lat, lon))
+
+    # Vizinhos dentro do limite de distância (raio em radianos)
+    nn = NearestNeighbors(radius=distance_limit / EARTH_RADIUS_KM, algorithm='ball_tree',
+                          metric='haversine', n_jobs=n_jobs).fit(coords)
+    dist, ind = nn.radius_neighbors(coords, return_distance=True)
 
-    norm_distance_matrix = np.zeros((n, n))
-    norm_time_matrix = np.zeros((n, n))
-    
-    for i in range(n):
-        for j in range(i + 1, n):
-            if distance_matrix[i][j] < 0:
-                norm_distance_matrix[i][j] = 99999
-            else:
-                norm_distance_matrix[i][j] = distance_matrix[i][j] / max_dist
-            norm_distance_matrix[j][i] = norm_distance_matrix[i][j]
+    rows = np.repeat(np.arange(n), [len(i) for i in ind])
+    cols = np.concatenate(ind)
+    dist_km = np.concatenate(dist) * EARTH_RADIUS_KM
 
-            if time_matrix[i][j] < 0:
-                norm_time_matrix[i][j] = 99999
-            else:
-                norm_time_matrix[i][j] = time_matrix[i][j] / max_time
-            norm_time_matrix[j][i] = norm_time_matrix[i][j]
+    # Mantém apenas os pares dentro do limite de tempo
+    delta = np.abs(days[rows] - days[cols])
+    within_time = delta <= time_limit
+    rows, cols = rows[within_time], cols[within_time]
+    dist_km, delta = dist_km[within_time], delta[within_time]
 
-    return norm_distance_matrix, norm_time_matrix
+    # Normalização pelos limites e soma das distâncias espacial e temporal
+    # (valores em float32, aceitos pelo DBSCAN com métrica 'precomputed')
+    total = dist_km / normalization_scale(distance_limit) + delta / normalization_scale(time_limit)
 
-def cluster_records(input_csv, output_csv, matrix_output_folder, time_limit, distance_limit):
+    return csr_matrix((total.astype(np.float32), (rows, cols)), shape=(n, n))
+
+def cluster_records(input_csv, output_csv, matrix_output_folder, time_limit, distance_limit, save_matrices=False, n_jobs=None, df=None):
     """
     Realiza a clusterização dos registros com base em distâncias espaciais e temporais
-    e salva as matrizes calculadas.
+    e, opcionalmente, salva as matrizes calculadas.
 
     Args:
-        input_csv (str): O caminho do arquivo CSV de entrada.
-        output_csv (str): O caminho para salvar o arquivo CSV de saída com os clusters.
+        input_csv (str): O caminho do arquivo CSV de entrada. Ignorado se 'df' for informado.
+        output_csv (str): O caminho para salvar o arquivo CSV de saída com os clusters
+                          (None para não salvar).
         matrix_output_folder (str): A pasta para salvar as matrizes de distância, tempo e total.
         time_limit (int): O limite de tempo em dias para a clusterização.
         distance_limit (float): O limite de distância em km para a clusterização.
+        save_matrices (bool): Se True, calcula e salva as matrizes densas de distância,
+                              tempo e total (modo de depuração, custo O(n²) em memória).
+        n_jobs (int): Número de threads para as consultas de vizinhança (-1 usa todos os núcleos).
+        df (pd.DataFrame, opcional): DataFrame de registros já carregado em memória
+                                     (por exemplo, a saída de geocode_data).
+
+    Returns:
+        pandas.DataFrame: Os registros com as colunas 'Cluster1' e 'Cluster2',
+                          ou None se ocorrer um erro.
     """
     try:
-        # Lendo o arquivo de entrada
-        base = pd.read_csv(input_csv)
+        # Lendo o arquivo de entrada (ou usando o DataFrame recebido)
+        base = pd.read_csv(input_csv) if df is None else df
         X = base.copy()
 
-        # Converter a coluna de data para o formato datetime
-        X['r_data'] = pd.to_datetime(X['r_data']).dt.date
+        # Converter a coluna de data para o formato datetime (apenas a data),
+        # mantendo o tipo datetime64 para que as diferenças em dias sejam vetorizadas
+        X['r_data'] = pd.to_datetime(X['r_data'], format='ISO8601').dt.normalize()
 
-        # Calcular as matrizes de tempo e distância
-        print("Calculando matrizes de distância e tempo...")
-        distance_matrix, time_matrix = calculate_dist_time(X, time_limit, distance_limit)
+        if save_matrices:
+            # Calcular as matrizes de tempo e distância (entre todos os registros)
+            print("Calculando matrizes de distância e tempo...")
+            distance_matrix, time_matrix, total_distance = calculate_dist_time(*extract_arrays(X), time_limit, distance_limit)
 
-        # Salvar as matrizes de tempo e distância
-        df_distance_matrix = pd.DataFrame(distance_matrix)
-        df_distance_matrix.to_csv(os.path.join(matrix_output_folder, f"distance_matrix_{time_limit}d_{distance_limit}km.csv"), index=False)
-        print(f"Matriz de distância salva como '{os.path.join(matrix_output_folder, f'distance_matrix_{time_limit}d_{distance_limit}km.csv')}'.")
-        df_time_matrix = pd.DataFrame(time_matrix)
-        df_time_matrix.to_csv(os.path.join(matrix_output_folder, f"time_matrix_{time_limit}d_{distance_limit}km.csv"), index=False)
-        print(f"Matriz de tempo salva como '{os.path.join(matrix_output_folder, f'time_matrix_{time_limit}d_{distance_limit}km.csv')}'.")
+            # Salvar as matrizes de distância, tempo e distância total (formato binário .npy)
+            matrices = {
+                "distance_matrix": ("Matriz de distância", distance_matrix),
+                "time_matrix": ("Matriz de tempo", time_matrix),
+                "total_distance": ("Matriz de distância total", total_distance),
+            }
+            for name, (description, matrix) in matrices.items():
+                matrix_file = os.path.join(matrix_output_folder, f"{name}_{time_limit}d_{distance_limit}km.npy")
+                np.save(matrix_file, matrix)
+                print(f"{description} salva como '{matrix_file}'.")
 
-        # Calcular as matrizes normalizadas 
-        norm_distance_matrix, norm_time_matrix = calculate_normalized_matrices(distance_matrix, time_matrix)
+        # Registros com coordenadas e data exatamente iguais são reduzidos a um único ponto,
+        # com peso igual ao número de repetições (sem arredondamento: registros a qualquer
+        # distância não nula continuam distintos). O peso preserva o papel das repetições
+        # no min_samples do DBSCAN, e a ordem da primeira ocorrência preserva a numeração
+        # dos clusters.
+        keys = ['r_lat', 'r_long', 'r_data']
+        inverse = X.groupby(keys, sort=False, dropna=False).ngroup().to_numpy()
+        X_unique = X.drop_duplicates(subset=keys)
+        weights = np.bincount(inverse)
 
-        # Calcular a matriz total com a distância espacial e temporal
-        total_distance = np.add(norm_distance_matrix, norm_time_matrix)        
+        # Coordenadas e datas dos pontos únicos como arrays NumPy (extraídas uma única vez)
+        lat, lon, days = extract_arrays(X_unique)
 
-        # Salvar a matriz de distância total
-        df_total_distance = pd.DataFrame(total_distance)
-        df_total_distance.to_csv(os.path.join(matrix_output_folder, f"total_distance_{time_limit}d_{distance_limit}km.csv"), index=False)
-        print(f"Matriz de distância total salva como '{os.path.join(matrix_output_folder, f'total_distance_{time_limit}d_{distance_limit}km.csv')}'.")
+        # Calcular a matriz esparsa de vizinhança (apenas pares dentro dos limites)
+        print("Calculando vizinhança espaço-temporal...")
+        neighborhood = calculate_neighborhood_graph(lat, lon, days, time_limit, distance_limit, n_jobs)
 
         # Executar o DBSCAN com min_samples=1 para Cluster1
         dbs1 = DBSCAN(eps=500, min_samples=1, metric='precomputed')
-        labels1 = dbs1.fit_predict(total_distance)
-        X['Cluster1'] = labels1
+        labels1 = dbs1.fit_predict(neighborhood, sample_weight=weights)
+        X['Cluster1'] = labels1[inverse]
 
         # Executar o DBSCAN com min_samples=2 para Cluster2
         dbs2 = DBSCAN(eps=500, min_samples=2, metric='precomputed')
-        labels2 = dbs2.fit_predict(total_distance)
-        X['Cluster2'] = labels2
+        labels2 = dbs2.fit_predict(neighborhood, sample_weight=weights)
+        X['Cluster2'] = labels2[inverse]
         
         # Salvar o dataframe resultante
-        X.to_csv(output_csv, index=False)
-        print(f"O arquivo com os clusters foi salvo como '{output_csv}'.")
+        if output_csv is not None:
+            X.to_csv(output_csv, index=False)
+            print(f"O arquivo com os clusters foi salvo como '{output_csv}'.")
+
+        return X
 
     except FileNotFoundError:
         print(f"Erro: O arquivo '{input_csv}' não foi encontrado.")
+        return None
     except Exception as e:
         print(f"Ocorreu um erro durante a clusterização: {e}")
+        return None
 
 if __name__ == '__main__':
     # Defina os caminhos dos arquivos de entrada e saída
@@ -159,4 +286,4 @@ if __name__ == '__main__':
     output_file = f'{path}/clusters_{time_limit_days}d_{distance_limit_km}km.csv'
 
     # Chama a função principal
-    cluster_records(input_file, output_file, matrix_output_folder, time_limit=time_limit_days, distance_limit=distance_limit_km)
\ No newline at end of file
+    cluster_records(input_file, output_file, matrix_output_folder, time_limit=time_limit_days, distance_limit=distance_limit_km, n_jobs=-1)
\ No newline at end of file
@@ -1,125 +1,143 @@
 import pandas as pd
 import numpy as np
-from geopy.distance import geodesic
 
-def calculate_spatial_extent(df):
+# Raio médio da Terra (IUGG), em km
+EARTH_RADIUS_KM = 6371.0088
+
+def calculate_spatial_extent(loc_data):
     """
-    Calcula a extensão espacial (distância geodésica entre os pontos
-    mais distantes) para cada cluster.
+    Calcula a extensão espacial (distância de Haversine entre os pontos
+    mais distantes) de cada cluster, de forma vetorizada sobre todos os clusters,
+    a partir das coordenadas mínimas e máximas já agregadas por cluster.
     """
-    loc_data = df.groupby(['Cluster1','Cluster2']).agg(
-        r_lat_min=('r_lat', 'min'),
-        r_lat_max=('r_lat', 'max'),
-        r_long_min=('r_long', 'min'),
-        r_long_max=('r_long', 'max')
-    )
-    
-    extensao = []
-    for index, row in loc_data.iterrows():
-        coords1 = (row['r_lat_min'], row['r_long_min'])
-        coords2 = (row['r_lat_max'], row['r_long_max'])
-        dist = geodesic(coords1, coords2).km
-        extensao.append(dist)
-    
-    loc_data['extensao'] = extensao
-    return loc_data[['extensao']]
+    lat1 = np.deg2rad(loc_data['r_lat_min'].to_numpy())
+    lat2 = np.deg2rad(loc_data['r_lat_max'].to_numpy())
+    lon1 = np.deg2rad(loc_data['r_long_min'].to_numpy())
+    lon2 = np.deg2rad(loc_data['r_long_max'].to_numpy())
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
 
 def standardize_data(df):
     """
-    Uniformização dos campos 'classificação' e 'doença' no df original
+    Uniformização dos campos 'classificação' e 'doença' no df original.
+
+    Cada campo é processado com uma única extração por expressão regular.
+    Na classificação, a prioridade é "Confirmada" > "Indeterminada" > "Descartada";
+    valores sem correspondência são mantidos. Os campos são convertidos para 'category'.
     """
-    df['d_classificacao'] = np.where( df['d_classificacao'].notna() & df['d_classificacao'].str.contains('"Confirmada"'), '"Confirmada"', df['d_classificacao']) 
-    df['d_classificacao'] = np.where( df['d_classificacao'].notna() & df['d_classificacao'].str.contains('"Indeterminada"'), '"Indeterminada"', df['d_classificacao']) 
-    df['d_classificacao'] = np.where( df['d_classificacao'].notna() & df['d_classificacao'].str.contains('"Descartada"'), '"Descartada"', df['d_classificacao']) 
-    df['d_doenca'] = np.where( df['d_doenca'].notna() & df['d_doenca'].str.contains('"Febre Amarela"'), '"Febre Amarela"', df['d_classificacao']) 
+    classificacao = df['d_classificacao'].str.extract(
+        r'^(?:.*("Confirmada")|.*("Indeterminada")|.*("Descartada"))'
+    ).bfill(axis=1).iloc[:, 0]
+    df['d_classificacao'] = classificacao.fillna(df['d_classificacao']).astype('category')
+
+    doenca = df['d_doenca'].str.extract(r'("Febre Amarela")', expand=False)
+    df['d_doenca'] = doenca.fillna(df['d_doenca']).astype('category')
 
     return df
 
 
-def calculate_cluster_characteristics(input_csv, output_csv):
+def calculate_cluster_characteristics(input_csv, output_csv, df=None):
     """
     Calcula as características de cada cluster a partir de um arquivo CSV
     que já contém os registros com suas respectivas atribuições de cluster.
 
     Args:
         input_csv (str): Caminho para o arquivo CSV de entrada com os clusters.
+                         Ignorado se 'df' for informado.
         output_csv (str): Caminho para salvar o arquivo CSV de saída com as
-                          características dos clusters.
+                          características dos clusters (None para não salvar).
+        df (pd.DataFrame, opcional): Registros com os clusters já carregados em memória
+                                     (por exemplo, a saída de cluster_records).
+
+    Returns:
+        pandas.DataFrame: As características dos clusters (uma linha por geocode),
+                          ou None se ocorrer um erro.
     """
     try:
-        # Leitura do arquivo de entrada com os clusters
-        data = pd.read_csv(input_csv, index_col=0)
-        
+        # Leitura do arquivo de entrada com os clusters (ou cópia do DataFrame recebido)
+        data = pd.read_csv(input_csv, index_col=0) if df is None else df.copy()
+
+        # Chaves dos clusters em inteiros de 32 bits (tabelas de hash menores no groupby)
+        data[['Cluster1','Cluster2']] = data[['Cluster1','Cluster2']].astype('int32')
+
         # Converter a coluna de data para o formato datetime, se ainda não estiver
         data['r_data'] = pd.to_datetime(data['r_data'])
 
         # Uniformizar os atributos de classificação e doença  
         data_uniform = standardize_data(data)
             
-        # df contendo os registros com os clusters        
-        df_clusters = data_uniform.copy()        
-
-        # 1. Calcular a quantidade de 'mortos' e 'vivos' por cluster
-        count_situacao = df_clusters.groupby(["Cluster1","Cluster2","a_situacao"])['a_quantidade'].sum().unstack(fill_value=0)
-        count_situacao = count_situacao.rename(columns={'Morto': 'morto', 'Vivo': 'vivo'})
-
-        # 2. Calcular a quantidade de 'Normal', 'Doente', 'Estranho' e 'Agressivo' por cluster
-        # As categorias 'Normal', 'Doente', 'Estranho' e 'Agressivo' só aparecem quando 'a_comportamento' é diferente de nulo
-        #   Essas categorias só aparecem quando tem animal vivo no cluster
-        # Neste caso, criei uma catedoria 'sem_info' quando não houver informação em 'a_comportamento', ou seja,
-        #   quando no cluster só tiver animais mortos.
-        # Em seguida, eu deleto a coluna 'sem_info'.
-        # Assim, consegui garantir o valor 'zero' em todas as colunas onde só tem animais mortos no cluster
-        df = df_clusters.copy()        
-        df.loc[df['a_comportamento'].isnull(), 'a_comportamento'] = 'sem_info'        
-        count_comportamento = df.groupby(["Cluster1","Cluster2","a_comportamento"])["a_quantidade"].sum().unstack(fill_value=0)
-        count_comportamento = count_comportamento.rename(columns={'Normal':"normal",'Estranho':"estranho", 'Doente': "doente", 'Agressivo': "agressivo"})        
-        count_comportamento = count_comportamento.drop(columns='sem_info')
-
-        # 3. Calcular a soma da quantidade de animais por cluster
-        quant_animais = df_clusters.groupby(["Cluster1","Cluster2"])['a_quantidade'].sum().rename('a_quant')        
-
-        # 4. Calcular o intervalo de tempo de cada cluster
-        dates = df_clusters.groupby(["Cluster1","Cluster2"])['r_data'].agg(['min', 'max']).rename(columns={'min':"data_ini",'max':"data_fim"})
-        dates["intervalo"] = (dates["data_fim"] - dates["data_ini"]).dt.days 
-        dates["intervalo"] = dates["intervalo"].apply(lambda x: x if x > 0 else 1)                
-
-        # 5. Calcular a extensão espacial de cada cluster 
-        extensao = calculate_spatial_extent(df_clusters)
-
-        # 6. Calcula o número de registros confirmados por alguma doença
-        confirmados_por_cluster = df_clusters.groupby(["Cluster1","Cluster2"])['d_classificacao'].apply(
-            lambda x: (x == '"Confirmada"').sum()
-        ).rename("confirmado")   
-
-        # 6.1. Lista completa de geocodes por cluster
+        # df contendo os registros com os clusters
+        df_clusters = data_uniform
+
+        # Tabela de consulta (pequena) com o município e a UF de cada geocode
+        geo_map = df_clusters[['geocode', 'MUN', 'UF']].drop_duplicates('geocode').set_index('geocode')
+
+        # 1. Indicadores por registro: quantidade de animais 'mortos' e 'vivos', quantidade por
+        # comportamento ('Normal', 'Doente', 'Estranho' e 'Agressivo') e registro confirmado.
+        # Os comportamentos só aparecem quando há animal vivo; registros sem informação
+        # em 'a_comportamento' contribuem com zero em todas essas colunas.
+        quantidade = df_clusters['a_quantidade']
+        situacao = df_clusters['a_situacao']
+        comportamento = df_clusters['a_comportamento']
+        df_clusters = df_clusters.assign(
+            morto=quantidade.where(situacao == 'Morto', 0),
+            vivo=quantidade.where(situacao == 'Vivo', 0),
+            agressivo=quantidade.where(comportamento == 'Agressivo', 0),
+            doente=quantidade.where(comportamento == 'Doente', 0),
+            estranho=quantidade.where(comportamento == 'Estranho', 0),
+            normal=quantidade.where(comportamento == 'Normal', 0),
+            confirmado=(df_clusters['d_classificacao'] == '"Confirmada"').astype(int),
+        )
+
+        # 2. Agregar todos os atributos por cluster em uma única passada do groupby
+        # (sem ordenar os grupos; apenas o resultado agregado, bem menor, é ordenado)
+        df_clusters_union = df_clusters.groupby(['Cluster1','Cluster2'], sort=False).agg(
+            a_quant=('a_quantidade', 'sum'),
+            morto=('morto', 'sum'),
+            vivo=('vivo', 'sum'),
+            agressivo=('agressivo', 'sum'),
+            doente=('doente', 'sum'),
+            estranho=('estranho', 'sum'),
+            normal=('normal', 'sum'),
+            data_ini=('r_data', 'min'),
+            data_fim=('r_data', 'max'),
+            r_lat_min=('r_lat', 'min'),
+            r_lat_max=('r_lat', 'max'),
+            r_long_min=('r_long', 'min'),
+            r_long_max=('r_long', 'max'),
+            confirmado=('confirmado', 'sum'),
+            num_reg=('Cluster1', 'size'),
+        ).sort_index()
+
+        # 3. Calcular o intervalo de tempo de cada cluster (mínimo de 1 dia)
+        df_clusters_union['intervalo'] = (df_clusters_union['data_fim'] - df_clusters_union['data_ini']).dt.days.clip(lower=1)
+
+        # 4. Calcular a extensão espacial de cada cluster
+        df_clusters_union['extensao'] = calculate_spatial_extent(df_clusters_union)
+
+        df_clusters_union = df_clusters_union[[
+            'a_quant', 'morto', 'vivo', 'agressivo', 'doente', 'estranho', 'normal',
+            'intervalo', 'data_ini', 'data_fim', 'extensao', 'confirmado', 'num_reg'
+        ]]
+
+        # 5. Lista completa de geocodes por cluster
         geocodes_list = (
-            df_clusters.groupby(["Cluster1","Cluster2"])["geocode"]
-            .apply(lambda x: sorted(x.unique()))
+            df_clusters[['Cluster1','Cluster2','geocode']]
+            .drop_duplicates()
+            .sort_values('geocode')
+            .groupby(['Cluster1','Cluster2'], sort=False)['geocode']
+            .agg(list)
             .rename("geocode_list")
-        )   
-        #print(geocodes_list[geocodes_list.apply(len) > 1])                                        
-
-        # 7. Unir todos os atributos calculados
-        df_clusters_union = (
-            pd.DataFrame(quant_animais)
-            .join(count_situacao, on=['Cluster1','Cluster2'])
-            .join(count_comportamento, on=['Cluster1','Cluster2'])
-            .join(dates[['intervalo','data_ini','data_fim']], on=['Cluster1','Cluster2'])
-            .join(extensao, on=['Cluster1','Cluster2'])            
-            .join(confirmados_por_cluster, on=['Cluster1','Cluster2'])
-        )        
-
-        # 8. Calcular número de registros por cluster
-        df_clusters_union['num_reg'] = df_clusters.groupby(['Cluster1','Cluster2']).size()
-        
-        # 9. Calcular atributos de frequência
+        )
+
+        # 6. Calcular atributos de frequência
         df_clusters_union['freq_num_reg'] = df_clusters_union['num_reg'] / df_clusters_union['intervalo']
         df_clusters_union['freq_a_quant'] = df_clusters_union['a_quant'] / df_clusters_union['intervalo']
         df_clusters_union['freq_vivo'] = df_clusters_union['vivo'] / df_clusters_union['intervalo']
         df_clusters_union['freq_morto'] = df_clusters_union['morto'] / df_clusters_union['intervalo']
         
-        # 10. Calcular atributos de percentual
+        # 7. Calcular atributos de percentual
         df_clusters_union['perc_mortos'] = (df_clusters_union['morto'] / df_clusters_union['a_quant']).fillna(0)
         df_clusters_union['perc_vivos'] = (df_clusters_union['vivo'] / df_clusters_union['a_quant']).fillna(0)        
         df_clusters_union['perc_normal'] = (df_clusters_union['normal'] / df_clusters_union['a_quant']).fillna(0)        
@@ -128,7 +146,7 @@ def calculate_cluster_characteristics(input_csv, output_csv):
         df_clusters_union['perc_agressivo'] = (df_clusters_union['agressivo'] / df_clusters_union['a_quant']).fillna(0)        
         df_clusters_union.reset_index(inplace=True)    
         
-        # 11. Adicionar lista de geocodes ao dataframe
+        # 8. Adicionar lista de geocodes ao dataframe
         df_clusters_union = df_clusters_union.merge(
             geocodes_list,
             on=["Cluster1","Cluster2"],
@@ -139,23 +157,24 @@ def calculate_cluster_characteristics(input_csv, output_csv):
         # Renomear a coluna explodida
         df_clusters_exploded = df_clusters_exploded.rename(columns={"geocode_list": "geocode"})
         
-        # Adicionar as colunas MUN e UF com base no geocode
-        df_clusters_exploded = df_clusters_exploded.merge(
-            df_clusters[['geocode', 'MUN', 'UF']].drop_duplicates(),
-            on='geocode',
-            how='left'
-        )
+        # Adicionar as colunas MUN e UF com base no geocode (mesmo tipo do índice da tabela de consulta)
+        df_clusters_exploded['geocode'] = df_clusters_exploded['geocode'].astype(geo_map.index.dtype)
+        df_clusters_exploded = df_clusters_exploded.join(geo_map, on='geocode').reset_index(drop=True)
 
-        # 12. Salvar o dataframe resultante
+        # 9. Salvar o dataframe resultante
         #### df_clusters_union.to_csv(output_csv, index=True)
-        df_clusters_exploded.to_csv(output_csv, index=True)
+        if output_csv is not None:
+            df_clusters_exploded.to_csv(output_csv, index=True)
+            print(f"O arquivo com as características dos clusters foi salvo como '{output_csv}'.")
 
-        print(f"O arquivo com as características dos clusters foi salvo como '{output_csv}'.")
+        return df_clusters_exploded
 
     except FileNotFoundError:
         print(f"Erro: O arquivo '{input_csv}' não foi encontrado.")
+        return None
     except Exception as e:
         print(f"Ocorreu um erro durante a análise dos clusters: {e}")
+        return None
 
 
 if __name__ == '__main__':
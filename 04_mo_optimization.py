@@ -1,20 +1,39 @@
 import numpy as np
 import pandas as pd
-from scipy.optimize import minimize
-from sklearn.preprocessing import StandardScaler, MinMaxScaler
+from itertools import combinations
+from scipy.optimize import minimize, OptimizeResult
 
-def process_data(input_csv):
+# Numba é opcional: acelera a função objetivo chamada repetidamente pelo SLSQP
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Características a serem usadas no índice de alerta
+# A ordem deve ser a mesma dos pesos
+ALERT_COLS = ("num_reg", "intervalo", "freq_num_reg", "freq_a_quant", "extensao", "perc_mortos", "morto")
+
+def process_data(input_csv, dtypes=None):
     """
     Lê o arquivo de entrada e prepara os dados para a análise.
     
     Args:
         input_csv (str): Caminho para o arquivo CSV de entrada com as
                          características dos clusters.
+        dtypes (dict, opcional): Colunas a serem lidas e seus tipos. Se None,
+                         lê todas as colunas com inferência de tipos.
     Returns:
         pd.DataFrame: DataFrame original com os dados carregados.
     """
     try:
-        df = pd.read_csv(input_csv, index_col=0)
+        if dtypes is None:
+            df = pd.read_csv(input_csv, index_col=0, engine='pyarrow')
+        else:
+            # '' é a coluna do índice (sem nome) gravada por 03_cluster_characterization.py
+            df = pd.read_csv(input_csv, index_col=0, engine='pyarrow',
+                             usecols=[''] + list(dtypes), dtype=dtypes)
+        df.index.name = None
         return df
     except FileNotFoundError:
         print(f"Erro: O arquivo '{input_csv}' não foi encontrado.")
@@ -27,51 +46,85 @@ def normalize_and_standardize_data(df, columns):
     """
     Padroniza (Z-score) e normaliza (Min-Max) colunas de um DataFrame.
     
+    As estatísticas (média, desvio padrão populacional, mínimo e máximo) são
+    calculadas sobre um único array NumPy, com o mesmo resultado de
+    StandardScaler e MinMaxScaler: colunas constantes têm escala 1.
+    
     Args:
         df (pd.DataFrame): DataFrame de entrada.
         columns (list): Lista de colunas a serem processadas.
     Returns:
         tuple: Uma tupla contendo o DataFrame padronizado e o DataFrame normalizado.
     """
-    df_standardized = df.copy()
-    df_normalized = df.copy()
+    A = df[columns].to_numpy(np.float64)
+    mean = A.mean(axis=0)
+    std = A.std(axis=0)
+    col_min = A.min(axis=0)
+    col_range = A.max(axis=0) - col_min
 
-    # Padronização Z-score
-    scaler_standard = StandardScaler()
-    df_standardized[columns] = scaler_standard.fit_transform(df[columns])
+    # Evita divisão por zero em colunas constantes
+    std[std == 0] = 1
+    col_range[col_range == 0] = 1
 
-    # Normalização Min-Max
-    scaler_minmax = MinMaxScaler()
-    df_normalized[columns] = scaler_minmax.fit_transform(df[columns])
+    # Padronização Z-score e normalização Min-Max. assign() substitui apenas as
+    # colunas processadas; as demais são compartilhadas com df (copy-on-write)
+    # em vez de copiadas.
+    df_standardized = df.assign(**dict(zip(columns, ((A - mean) / std).T)))
+    df_normalized = df.assign(**dict(zip(columns, ((A - col_min) / col_range).T)))
 
     return df_standardized, df_normalized
 
-def objective_function(weights, data, alpha):
+if NUMBA_AVAILABLE:
+    @njit(fastmath=True, cache=True)
+    def _objective_kernel(weights, c, C, alpha):
+        """
+        Kernel compilado (Numba) equivalente a objective_function(), sem
+        alocações nem chamadas ao NumPy a cada avaliação.
+        """
+        k = weights.shape[0]
+        f1 = 0.0
+        f2 = 0.0
+        for i in range(k):
+            f1 += c[i] * weights[i]
+            Cw = 0.0
+            for j in range(k):
+                Cw += C[i, j] * weights[j]
+            f2 += weights[i] * Cw
+
+        return -(alpha*f1 - (1-alpha)*f2)
+
+def objective_function(weights, c, C, alpha):
     """
     Função objetivo para a otimização, buscando um equilíbrio
     entre a maximização do índice de alerta e a minimização da variância.
     
     A otimização busca minimizar o valor retornado.
     
+    Com X a matriz (clusters x características) do índice de alerta, a média
+    do índice ponderada por 'morto' é f1 = c^T w, com c = X^T m / soma(m), e sua
+    variância é f2 = w^T C w, com C = Cov(X). Como c e C não dependem dos
+    pesos, cada avaliação custa O(k^2) em vez de O(clusters x k).
+    
     Args:
         weights (np.array): Pesos para cada característica.
-        data (pd.DataFrame): DataFrame com os dados normalizados.
+        c (np.array): Média das características ponderada pela coluna 'morto'.
+        C (np.array): Matriz de covariância (populacional) das características.
+        alpha (float): Peso do objetivo f1 na soma ponderada.
+    
+    Usa o kernel compilado com Numba quando disponível; caso contrário,
+    recorre ao cálculo vetorizado com NumPy.
     
     Returns:
         float: Valor da função objetivo (a ser minimizado).
     """
-    # Características a serem usadas no índice de alerta
-    # A ordem deve ser a mesma dos pesos
-    alert_cols = [ "num_reg", "intervalo", "freq_num_reg", "freq_a_quant", "extensao","perc_mortos", "morto"]
-
-    # Calcula o índice de alerta para cada cluster
-    alert_index = np.dot(data[alert_cols], weights)                 
+    if NUMBA_AVAILABLE:
+        return _objective_kernel(weights, c, C, alpha)
 
     # Objetivo: maximizar o índice de alerta para os casos confirmados
     # e minimizar a variância do índice.
     
-    f1 = np.average(alert_index,weights = data['morto']) # Maximizar a média do índice ponderado pelo num. de mortos
-    f2 = np.var(alert_index)   # Minimizar a variância do índice
+    f1 = c @ weights # Maximizar a média do índice ponderado pelo num. de mortos
+    f2 = weights @ C @ weights   # Minimizar a variância do índice
         
     # Soma ponderada dos pesos
     obj = alpha*f1 - (1-alpha)*f2
@@ -79,21 +132,24 @@ def objective_function(weights, data, alpha):
     return -obj #(maximizar)
 
 
-def salve_results(path, solution):
-    '''
-    Salvar soluções em arquivo (padrão numpy e padrão tabela para Latex)
-    '''
-    ## INCOMPLETO!! CONCLUIR
+def objective_gradient(weights, c, C, alpha):
+    """
+    Gradiente analítico de objective_function() em relação aos pesos.
     
-    with open(f'{path}/results/solution_vectors.txt', 'w') as arquivo:
-        for alpha, data in results.items():
-            print(f"--- Resultados para alpha = {alpha} ---")
-            for key, value in data.items():
-                print(f"{key}: {value}")
-            print("\n")
-        
+    f1 = c^T w é linear nos pesos (gradiente c) e f2 = w^T C w é quadrática
+    (gradiente 2 C w), de modo que o SLSQP não precisa estimar o gradiente
+    por diferenças finitas.
+    
+    Args:
+        Os mesmos de objective_function().
+    
+    Returns:
+        np.array: Gradiente da função objetivo (a ser minimizada).
+    """
+    return -(alpha*c - (1-alpha)*2*(C @ weights))
 
-def calculate_objective_values(weights, data):
+
+def calculate_objective_values(weights, c, C):
     """
     Esta função apenas calcula o valor dos objetivos separadamente.
     Não consegui utilizar a função objective_function() pois ela é chamada pelo métodos de otimização.
@@ -101,22 +157,85 @@ def calculate_objective_values(weights, data):
     Neste caso, preciso da informação dos dois objetivos para gerar a Fronteira de Pareto.
     """
 
-    # Características a serem usadas no índice de alerta
-    # A ordem deve ser a mesma dos pesos
-    alert_cols = [ "num_reg", "intervalo", "freq_num_reg", "freq_a_quant", "extensao","perc_mortos", "morto"]
-
-    # Calcula o índice de alerta para cada cluster
-    alert_index = np.dot(data[alert_cols], weights)                 
-
     # Objetivo: maximizar o índice de alerta para os casos confirmados
     # e minimizar a variância do índice.
     
-    f1 = np.average(alert_index,weights = data['morto']) # Maximizar a média do índice ponderado pelo num. de mortos
-    f2 = np.var(alert_index)   # Minimizar a variância do índice
+    f1 = c @ weights # Maximizar a média do índice ponderado pelo num. de mortos
+    f2 = weights @ C @ weights   # Minimizar a variância do índice
 
     return f1, f2
         
 
+def solve_simplex_qp(C, c, alphas, tol=1e-12):
+    """
+    Resolve de forma exata, para todos os valores de alpha de uma vez, o
+    problema quadrático convexo
+    
+        min (1-alpha) w^T C w - alpha c^T w   sujeito a   soma(w) = 1,  w >= 0
+    
+    enumerando os possíveis suportes (conjuntos de pesos não nulos). Dividindo
+    o objetivo por (1-alpha), as condições KKT de cada suporte S formam o
+    sistema [[2 C_SS, 1], [1^T, 0]] [w_S, nu] = [t c_S, 1], com t = alpha/(1-alpha).
+    A matriz não depende de alpha, então cada suporte é fatorado uma única vez
+    e w_S(t) = t*u + v vale para todos os alphas. Entre as soluções viáveis
+    (w_S >= 0), a de menor objetivo é o ótimo global, pois o problema é
+    convexo. Para alpha = 1 o problema é linear e o ótimo é o vértice de maior c.
+    
+    Args:
+        C (np.array): Matriz de covariância (n x n) das características.
+        c (np.array): Vetor (n) com a média das características ponderada por 'morto'.
+        alphas (np.array): Valores de alpha.
+        tol (float): Tolerância para aceitar pesos levemente negativos.
+    
+    Returns:
+        list: Um OptimizeResult (mesmo formato de scipy.optimize.minimize()) por alpha.
+    """
+    n = len(c)
+    alphas = np.asarray(alphas, dtype=np.float64)
+    linear = np.isclose(alphas, 1)
+    t = np.where(linear, 0, alphas) / np.where(linear, 1, 1 - alphas)
+
+    best_w = np.zeros((len(alphas), n))
+    best_fun = np.full(len(alphas), np.inf)
+
+    for k in range(1, n + 1):
+        for S in combinations(range(n), k):
+            S = list(S)
+            K = np.zeros((k + 1, k + 1))
+            K[:k, :k] = 2 * C[np.ix_(S, S)]
+            K[:k, k] = 1
+            K[k, :k] = 1
+            rhs = np.zeros((k + 1, 2))
+            rhs[:k, 0] = c[S]
+            rhs[k, 1] = 1
+            try:
+                u, v = np.linalg.solve(K, rhs)[:k].T
+            except np.linalg.LinAlgError:
+                continue # Suporte degenerado: o ótimo está em um suporte menor
+
+            w_S = np.outer(t, u) + v
+            feasible = np.all(w_S >= -tol, axis=1) & ~linear
+            if not feasible.any():
+                continue
+
+            w = np.zeros((len(alphas), n))
+            w[:, S] = np.clip(w_S, 0, None)
+            w /= w.sum(axis=1, keepdims=True)
+            fun = (1 - alphas) * np.einsum('ij,jk,ik->i', w, C, w) - alphas * (w @ c)
+
+            better = feasible & (fun < best_fun)
+            best_w[better] = w[better]
+            best_fun[better] = fun[better]
+
+    # alpha = 1: objetivo linear, o ótimo é um vértice do simplex
+    best_w[linear] = np.eye(n)[np.argmax(c)]
+    best_fun[linear] = -c.max()
+
+    return [OptimizeResult(x=w, fun=fun, success=bool(np.isfinite(fun)),
+                           message='Solução exata pelas condições KKT')
+            for w, fun in zip(best_w, best_fun)]
+
+
 if __name__ == '__main__':
 
     # 1. Defina os caminhos e parâmetros
@@ -126,145 +245,143 @@ if __name__ == '__main__':
     distance_limit = 1
     input_file = f"{path}/clusters_{time_limit}d_{distance_limit}km_caracterizados.csv"
 
-    # 2. Carrega e prepara os dados
-    df_original = process_data(input_file)
+    # Método de otimização: 'qp' resolve o problema quadrático de forma exata;
+    # 'slsqp' reproduz o procedimento original com scipy.optimize.minimize()
+    solver = 'qp'
 
-    if df_original is None:
-        exit()
+    # Salva os dados padronizados e normalizados em CSV (não são usados a seguir)
+    save_intermediate = False
 
     base_col = ["morto", "vivo", "a_quant", "intervalo", "num_reg", "confirmado",
                 "freq_num_reg", "freq_morto", "freq_vivo", "freq_a_quant",
                 "perc_mortos", "perc_vivos", "perc_agressivo", "perc_doente",
                 "perc_estranho", "perc_normal", "extensao"]
 
+    # 2. Carrega e prepara os dados (apenas as colunas utilizadas)
+    dtypes = {'Cluster1': 'int32', 'Cluster2': 'int32', **{col: 'float64' for col in base_col}}
+    df_original = process_data(input_file, dtypes)
+
+    if df_original is None:
+        exit()
+
     # Normalize e padronize os dados
     df_standardized, df_normalized = normalize_and_standardize_data(df_original, base_col)
     
     # Salvar arquivos (opcional, como no script original)
-    output_standardized_file = f"{path}/clusters_{time_limit}d_{distance_limit}km_caracterizados_padronizado.csv"
-    output_normalized_file = f"{path}/clusters_{time_limit}d_{distance_limit}km_caracterizados_normalizado.csv"
-    df_standardized.to_csv(output_standardized_file, index=True)
-    df_normalized.to_csv(output_normalized_file, index=True)
-    print(f"Dados padronizados (Z-score) salvos em '{output_standardized_file}'.")
-    print(f"Dados normalizados (Min-Max) salvos em '{output_normalized_file}'.")
-
-    # Filtrar por clusters com mais de um registros
-    filtered_df_original = df_original[df_original['Cluster2'] != -1]    
-    filtered_df_standardized = df_standardized[df_standardized['Cluster2'] != -1]
-
-    # Filtrar apenas pelos casos confirmados (sem considerear clusters duplicados)   
-    df_standardized_confirmed = filtered_df_standardized[filtered_df_original['confirmado'] != 0]  
-    df_standardized_filtered = df_standardized_confirmed.drop_duplicates(subset=['Cluster1'])    
-
-    # 3. Otimização com SLSQP
+    if save_intermediate:
+        output_standardized_file = f"{path}/clusters_{time_limit}d_{distance_limit}km_caracterizados_padronizado.csv"
+        output_normalized_file = f"{path}/clusters_{time_limit}d_{distance_limit}km_caracterizados_normalizado.csv"
+        df_standardized.to_csv(output_standardized_file, index=True)
+        df_normalized.to_csv(output_normalized_file, index=True)
+        print(f"Dados padronizados (Z-score) salvos em '{output_standardized_file}'.")
+        print(f"Dados normalizados (Min-Max) salvos em '{output_normalized_file}'.")
+
+    # Filtrar por clusters com mais de um registros e apenas pelos casos
+    # confirmados (sem considerar clusters duplicados). A máscara é aplicada
+    # uma única vez, somente às colunas usadas na otimização.
+    mask = ((df_original['Cluster2'] != -1) & (df_original['confirmado'] != 0)).to_numpy(copy=True)
+    mask[mask] = ~df_original.loc[mask, 'Cluster1'].duplicated().to_numpy()
+
+    # 3. Otimização (problema quadrático exato ou SLSQP)
     
     # As características do índice de alerta devem ser normalizadas para a otimização
     # Usaremos os dados normalizados para garantir que todas as colunas estejam na mesma escala (0-1).
-    alert_cols_for_opt = [ "num_reg", "intervalo", "freq_num_reg", "freq_a_quant", "extensao","perc_mortos", "morto"]
-    
+
     # Número de pesos (variáveis de decisão)
-    num_weights = len(alert_cols_for_opt)
+    num_weights = len(ALERT_COLS)
+
+    # Extrai as colunas do índice e a coluna de ponderação uma única vez.
+    # X usa float32 (metade da memória); c e C abaixo são acumulados em float64.
+    X = np.ascontiguousarray(df_standardized.loc[mask, list(ALERT_COLS)].to_numpy(np.float32))
+    m = df_standardized.loc[mask, 'morto'].to_numpy(np.float64)
+    inv_m_sum = 1.0 / m.sum()
+
+    # f1 = c^T w e f2 = w^T C w; c e C não dependem dos pesos, então a função
+    # objetivo opera apenas sobre eles
+    c = (X.T @ m) * inv_m_sum
+    C = np.cov(X, rowvar=False, bias=True)
     
     # Restrições para o SLSQP
     # 1. A soma dos pesos deve ser igual a 1
     # 2. Cada peso deve ser maior ou igual a 0
-    constraints = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1})
+    constraints = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: np.ones_like(w)})
     bounds = [(0, 1) for _ in range(num_weights)]
     
     # Definindo os valores de alpha
     alphas = np.arange(0, 1.1, 0.1) #[0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6,0.7, 0.8, 0.9, 1]
     
-    # Dicionário para armazenar os resultados
-    results = {}
+    # Arrays para armazenar os resultados: uma linha por alpha e uma última
+    # linha para o caso sem otimização (pesos uniformes)
+    num_solutions = len(alphas) + 1
+    W = np.empty((num_solutions, num_weights)) # Pesos
+    F = np.empty((num_solutions, 2))           # Objetivos f1 e f2
+    S = np.empty(num_solutions, dtype=bool)    # Sucesso da otimização
     
     print("\nIniciando a otimização para diferentes valores de alpha...")
     
-    solution = 1
-    for alpha in alphas:
-        # Chute inicial para os pesos (valores iguais, somando 1)
-        initial_weights = np.ones(num_weights) / num_weights
-        
-        result = minimize(
-            objective_function,
-            initial_weights,
-            args=(df_standardized_filtered, alpha), # Passa o alpha como argumento
-            method='SLSQP',
-            bounds=bounds,
-            constraints=constraints,
-            options={'disp': False, 'ftol':1e-10}
-        )
-        
-        optimal_weights = result.x
-        objective_1, objective_2 = calculate_objective_values(optimal_weights, df_standardized_filtered)        
+    # No caso 'qp' todos os alphas são resolvidos de uma só vez
+    if solver == 'qp':
+        qp_results = solve_simplex_qp(C, c, alphas)
+
+    # Chute inicial para os pesos (valores iguais, somando 1). Nos alphas
+    # seguintes, o SLSQP parte da solução do alpha anterior, que é próxima
+    # da nova solução ao longo da fronteira de Pareto.
+    initial_weights = np.ones(num_weights) / num_weights
+
+    # Mensagens de progresso, impressas de uma só vez ao final do laço
+    logs = []
 
+    for i, alpha in enumerate(alphas):
+        if solver == 'qp':
+            result = qp_results[i]
+        else:
+            result = minimize(
+                objective_function,
+                initial_weights,
+                args=(c, C, alpha), # Passa o alpha como argumento
+                method='SLSQP',
+                jac=objective_gradient,
+                bounds=bounds,
+                constraints=constraints,
+                options={'disp': False, 'ftol': 1e-10, 'maxiter': 50}
+            )
+            if result.success:
+                initial_weights = result.x
+        
         # Armazena os resultados
-        results[solution] = {
-            'success': result.success,
-            'weights': result.x if result.success else None,
-            'objective1' : objective_1,
-            'objective2' : objective_2,
-            'objective_value': result.fun if result.success else None,
-            'message': result.message
-        }
-        solution = solution + 1
-        print(f"Otimização para alpha={alpha:.1f} concluída.")   
+        W[i] = result.x
+        F[i] = calculate_objective_values(result.x, c, C)
+        S[i] = result.success
+        if result.success:
+            logs.append(f"Otimização para alpha={alpha:.1f} concluída.")
+        else:
+            logs.append(f"Otimização para alpha={alpha:.1f} falhou: {result.message}")
         '''
         print("\n--- Resultado da Otimização ---")
         print(f"Sucesso: {result.success}")
         print(f"Mensagem de erro completa: {result.message}")
-        print(f"Valor da função objetivo 1: ", objective_1)
-        print(f"Valor da função objetivo 2: ", objective_2)
+        print(f"Valor da função objetivo 1: ", F[i, 0])
+        print(f"Valor da função objetivo 2: ", F[i, 1])
         print(f"Pesos finais: {result.x}")
         print("\n")
         '''
 
+    print("\n".join(logs))
+
     print("\nCalculando objetivos para o caso sem otimização (pesos uniformes).\n")
 
     # Sem otimização de pesos
-    initial_weights = np.ones(num_weights) / num_weights
-    objective_1, objective_2 = calculate_objective_values(initial_weights, df_standardized_filtered)        
-    objective_value = 0.5*objective_1 - 0.5*objective_2 # valor não utilizado
-    
-    # Armazena os resultados 
-    results[solution] = {  
-        'success': 'True',      
-        'weights': initial_weights,
-        'objective1' : objective_1,
-        'objective2' : objective_2,
-        'objective_value': objective_value,
-    }
-
-    '''
-    # 4. Imprime os resultados da otimização
-    if result.success:
-        print("\nOtimização concluída com sucesso!\n")
-        for alpha, data in results.items():
-            print(f"--- Resultados para alpha = {alpha} ---")
-            for key, value in data.items():
-                print(f"{key}: {value}")
-            print("\n")
-    else:
-        print("A otimização falhou.")
-        print("Mensagem de erro:", result.message)
-    '''
+    W[-1] = np.ones(num_weights) / num_weights
+    F[-1] = calculate_objective_values(W[-1], c, C)
+    S[-1] = True
 
+    # 4. Imprime os resultados da otimização
     print("\n Final results: \n")
-    if result.success:
-        #print(f"Sol. \t n_rec \t interval \t freq_rec \t freq_animal \t extention \t perc_death \t n_death \t f1 \t f2")
-        print(f"{'Sol.':<6}{'n_rec':<8}{'interval':<10}{'freq_rec':<11}{'freq_animal':<13}"
-            f"{'extention':<11}{'perc_death':<12}{'n_death':<9}{'f1':<7}{'f2':<7}")
-        # Linhas de resultados
-        for alpha, data in results.items():
-            print(f"{alpha:<6}"                
-                f"{data['weights'][0]:<8.3f}"
-                f"{data['weights'][1]:<10.3f}"
-                f"{data['weights'][2]:<11.3f}"
-                f"{data['weights'][3]:<13.3f}"
-                f"{data['weights'][4]:<11.3f}"
-                f"{data['weights'][5]:<12.3f}"
-                f"{data['weights'][6]:<9.3f}"
-                f"{data['objective1']:<7.3f}"
-                f"{data['objective2']:<7.3f}")
+    if S.all():
+        table = pd.DataFrame(np.hstack([W, F]),
+                             index=pd.RangeIndex(1, num_solutions + 1, name='Sol.'),
+                             columns=['n_rec', 'interval', 'freq_rec', 'freq_animal', 'extention',
+                                      'perc_death', 'n_death', 'f1', 'f2'])
+        print(table.to_string(float_format='%.3f'))
     else:
-        print("A otimização falhou.")
-        print("Mensagem de erro:", result.message)
\ No newline at end of file
+        print("A otimização falhou.")
\ No newline at end of file
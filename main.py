@@ -0,0 +1,85 @@
+import argparse
+import importlib
+
+# Os scripts do pipeline começam com dígitos e, por isso, são carregados via importlib
+pre_process = importlib.import_module('01_1_pre_process')
+geocoding = importlib.import_module('01_2_geocoding')
+clustering = importlib.import_module('02_spatiotemporal_clustering')
+characterization = importlib.import_module('03_cluster_characterization')
+
+def run_pipeline(path, file, time_limit, distance_limit, persist=False, n_jobs=-1):
+    """
+    Executa em sequência o pré-processamento, o geocoding, a clusterização e a
+    caracterização dos clusters, passando os DataFrames diretamente entre as etapas
+    (sem gravar e reler os CSVs intermediários).
+
+    Args:
+        path (str): A pasta com os arquivos de entrada e saída.
+        file (str): O nome (sem extensão) do arquivo CSV de registros.
+        time_limit (int): O limite de tempo em dias para a clusterização.
+        distance_limit (float): O limite de distância em km para a clusterização.
+        persist (bool): Se True, também salva os CSVs intermediários de cada etapa.
+        n_jobs (int): Número de threads do spatial join e das consultas de vizinhança.
+
+    Returns:
+        pandas.DataFrame: As características dos clusters, ou None se alguma etapa falhar.
+    """
+    def intermediate(name):
+        return f'{path}/{name}.csv' if persist else None
+
+    # 1 -- Pré-processamento
+    df_filtrado = pre_process.preprocess_data(f'{path}/{file}.csv')
+    if df_filtrado is None:
+        return None
+    if persist:
+        df_filtrado.to_csv(intermediate(f'{file}_filtrado'), index=False)
+
+    # 2 -- Geocoding
+    _, df_6d = geocoding.geocode_data(
+        None,
+        intermediate(f'{file}_filtrado_limpo_geocode_7d'),
+        intermediate(f'{file}_filtrado_limpo_geocode_6d'),
+        f'{path}/BR_Municipios_2023/BR_Municipios_2023.shp',
+        f'{path}/BR_UF_2023/BR_UF_2023.shp',
+        f'{path}/BR_Municipios_2023/BR_Municipios_2023_4326.parquet',
+        n_jobs=n_jobs,
+        df_pontos=df_filtrado
+    )
+    if df_6d is None:
+        return None
+
+    # 3 -- Clusterização espaço-temporal
+    df_clusters = clustering.cluster_records(
+        None,
+        intermediate(f'clusters_{time_limit}d_{distance_limit}km'),
+        f'{path}/distance_matrix',
+        time_limit=time_limit,
+        distance_limit=distance_limit,
+        n_jobs=n_jobs,
+        df=df_6d
+    )
+    if df_clusters is None:
+        return None
+
+    # 4 -- Caracterização dos clusters (sempre salva, é a entrada de 04_mo_optimization.py)
+    return characterization.calculate_cluster_characteristics(
+        None,
+        f'{path}/clusters_{time_limit}d_{distance_limit}km_caracterizados.csv',
+        df=df_clusters
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Executa o pipeline de pré-processamento, geocoding, clusterização e caracterização.")
+    parser.add_argument('--persist', action='store_true', help="Salva também os CSVs intermediários de cada etapa.")
+    args = parser.parse_args()
+
+    ##-- PNH
+    path = 'data_plos'
+    file = 'registros_macacos_micos_01_05_2014_ate_31_12_2024'
+    time_limit_days = 30
+    distance_limit_km = 1
+
+    df_caracterizados = run_pipeline(path, file, time_limit_days, distance_limit_km, persist=args.persist)
+
+    if df_caracterizados is not None:
+        print("\nPipeline concluído com sucesso.")